@@ -4,22 +4,32 @@ API FastAPI para reconhecimento facial usando face_recognition
 """
 
 import os
-import base64
-import io
-from typing import Optional
-from fastapi import FastAPI, HTTPException
+from typing import Any, NamedTuple, Optional
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from dotenv import load_dotenv
+from deadline import remaining_time, resolve_deadline
+from decoding import decode_base64
+from model_pool import ModelPool, configure_native_threads
+from nextcloud import download_with_deadline
+from sites import load_site_shards, resolve_site, split_by_site
+
+# Carregar variáveis de ambiente (antes de ler NATIVE_NUM_THREADS e importar numpy/cv2)
+load_dotenv()
+
+# Threads internas do OpenCV/BLAS por requisição (evita oversubscription,
+# já que as requisições rodam em paralelo no threadpool do FastAPI)
+NATIVE_NUM_THREADS = int(os.getenv("NATIVE_NUM_THREADS", "1"))
+configure_native_threads(NATIVE_NUM_THREADS)
+
+import cv2
+import dlib
 import face_recognition
+import face_recognition_models
 import numpy as np
-from PIL import Image
-import requests
 from requests.auth import HTTPBasicAuth
 
-# Carregar variáveis de ambiente
-load_dotenv()
-
 app = FastAPI(title="Face Recognition Service", version="1.0.0")
 
 # Configurar CORS
@@ -36,6 +46,48 @@ NEXTCLOUD_WEBDAV_URL = os.getenv("NEXTCLOUD_WEBDAV_URL", "http://192.168.15.10/r
 NEXTCLOUD_USER = os.getenv("NEXTCLOUD_USER", "")
 NEXTCLOUD_PASSWORD = os.getenv("NEXTCLOUD_PASSWORD", "")
 FACE_MATCH_THRESHOLD = float(os.getenv("FACE_MATCH_THRESHOLD", "0.6"))
+NEXTCLOUD_TIMEOUT = float(os.getenv("NEXTCLOUD_TIMEOUT", "10"))
+
+# Orçamento de latência por requisição em milissegundos (0 = sem limite)
+# Pode ser sobrescrito por requisição com o header X-Deadline-Ms
+REQUEST_DEADLINE_MS = int(os.getenv("REQUEST_DEADLINE_MS", "0"))
+# Score a partir do qual a busca para no primeiro match (sem visitar o resto da lista)
+# O score aqui é 1 - distância do dlib: 0.65 equivale a distância <= 0.35,
+# comum entre fotos da mesma pessoa (o match exige distância <= 0.4)
+EARLY_EXIT_SCORE = float(os.getenv("EARLY_EXIT_SCORE", "0.65"))
+# Arquivo JSON com o mapeamento site -> dispositivos/geofence/colaboradores
+SITES_CONFIG_PATH = os.getenv("SITES_CONFIG_PATH", "sites.json")
+# Tamanho do pool de modelos (requisições que usam os modelos dlib ao mesmo tempo por worker)
+# Padrão 1: cada instância carrega detector + preditor + encoder ResNet na memória,
+# e o ganho de paralelismo do dlib no mesmo worker ainda não foi medido
+MODEL_POOL_SIZE = int(os.getenv("MODEL_POOL_SIZE", "1"))
+
+cv2.setNumThreads(NATIVE_NUM_THREADS)
+
+
+class DlibModels(NamedTuple):
+    detector: Any
+    pose_predictor: Any
+    encoder: Any
+
+
+def load_dlib_models() -> DlibModels:
+    """Carrega os mesmos modelos usados por face_recognition.face_encodings"""
+    return DlibModels(
+        detector=dlib.get_frontal_face_detector(),
+        pose_predictor=dlib.shape_predictor(face_recognition_models.pose_predictor_five_point_model_location()),
+        encoder=dlib.face_recognition_model_v1(face_recognition_models.face_recognition_model_location()),
+    )
+
+
+# Modelos do dlib não são thread-safe: cada requisição usa uma instância do pool
+# A primeira instância reaproveita os modelos já carregados no import do face_recognition
+encoder_pool = ModelPool(load_dlib_models, MODEL_POOL_SIZE, name="dlib")
+encoder_pool.add(DlibModels(
+    detector=face_recognition.api.face_detector,
+    pose_predictor=face_recognition.api.pose_predictor_5_point,
+    encoder=face_recognition.api.face_encoder,
+))
 
 
 class RecognizeRequest(BaseModel):
@@ -51,6 +103,8 @@ class RecognizeResponse(BaseModel):
     colaborador_nome: Optional[str] = None
     score: Optional[float] = None
     error: Optional[str] = None
+    partial: bool = False
+    site: Optional[str] = None
 
 
 def extract_nextcloud_path(url: str) -> Optional[str]:
@@ -80,47 +134,40 @@ def extract_nextcloud_path(url: str) -> Optional[str]:
     return None
 
 
-def download_image_from_nextcloud(file_path: str) -> Optional[bytes]:
-    """Baixa uma imagem do Nextcloud"""
-    try:
-        url = f"{NEXTCLOUD_WEBDAV_URL}/{file_path}"
-        response = requests.get(
-            url,
-            auth=HTTPBasicAuth(NEXTCLOUD_USER, NEXTCLOUD_PASSWORD),
-            timeout=10
-        )
-        
-        if response.status_code == 200:
-            return response.content
-        else:
-            print(f"Erro ao baixar imagem do Nextcloud: {response.status_code}")
-            return None
-    except Exception as e:
-        print(f"Exceção ao baixar imagem do Nextcloud: {e}")
+def download_image_from_nextcloud(file_path: str, deadline: Optional[float] = None) -> Optional[bytes]:
+    """Baixa uma imagem do Nextcloud respeitando o deadline da requisição"""
+    return download_with_deadline(
+        f"{NEXTCLOUD_WEBDAV_URL}/{file_path}",
+        HTTPBasicAuth(NEXTCLOUD_USER, NEXTCLOUD_PASSWORD),
+        NEXTCLOUD_TIMEOUT,
+        deadline
+    )
+
+
+# Shards de colaboradores por site (recarregável via POST /sites/reload)
+# Configuração inválida impede a inicialização (arquivo inexistente = sem shards)
+site_shards = load_site_shards(SITES_CONFIG_PATH)
+
+
+def bytes_to_image(image_data: bytes) -> Optional[np.ndarray]:
+    """Decodifica os bytes da imagem para array RGB (formato face_recognition)"""
+    # np.frombuffer cria apenas uma view sobre os bytes (sem cópia)
+    # IMREAD_IGNORE_ORIENTATION mantém o comportamento anterior do PIL (sem rotação EXIF)
+    image = cv2.imdecode(
+        np.frombuffer(image_data, np.uint8),
+        cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION
+    )
+    if image is None:
         return None
+    
+    # OpenCV decodifica em BGR; trocar os canais no próprio buffer
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=image)
 
 
 def base64_to_image(base64_string: str) -> Optional[np.ndarray]:
     """Converte base64 para array numpy (formato face_recognition)"""
     try:
-        # Remover prefixo data:image se existir
-        if "," in base64_string:
-            base64_string = base64_string.split(",")[1]
-        
-        # Decodificar base64
-        image_data = base64.b64decode(base64_string)
-        
-        # Converter para PIL Image
-        image = Image.open(io.BytesIO(image_data))
-        
-        # Converter para RGB se necessário
-        if image.mode != "RGB":
-            image = image.convert("RGB")
-        
-        # Converter para array numpy
-        image_array = np.array(image)
-        
-        return image_array
+        return bytes_to_image(decode_base64(base64_string))
     except Exception as e:
         print(f"Erro ao converter base64 para imagem: {e}")
         return None
@@ -130,13 +177,17 @@ def extract_face_encoding(image_array: np.ndarray) -> Optional[np.ndarray]:
     """Extrai encoding facial de uma imagem"""
     try:
         # face_recognition espera RGB
-        encodings = face_recognition.face_encodings(image_array)
-        
-        if len(encodings) == 0:
-            return None
-        
-        # Retornar o primeiro encoding (primeira face detectada)
-        return encodings[0]
+        # Mesmo pipeline de face_recognition.face_encodings (HOG com 1 upsample e
+        # landmarks de 5 pontos), mas com modelos exclusivos desta requisição
+        with encoder_pool.lease() as models:
+            detections = models.detector(image_array, 1)
+            
+            if len(detections) == 0:
+                return None
+            
+            # Retornar o primeiro encoding (primeira face detectada)
+            landmarks = models.pose_predictor(image_array, detections[0])
+            return np.array(models.encoder.compute_face_descriptor(image_array, landmarks, 1))
     except Exception as e:
         print(f"Erro ao extrair encoding facial: {e}")
         return None
@@ -166,8 +217,28 @@ async def root():
     return {"status": "ok", "service": "face-recognition"}
 
 
+@app.get("/metrics")
+async def metrics():
+    """Utilização do pool de modelos"""
+    return {"pools": [encoder_pool.metrics()]}
+
+
+@app.post("/sites/reload")
+async def reload_sites():
+    """Recarrega o mapeamento de sites (shards) sem reiniciar o serviço"""
+    global site_shards
+    try:
+        shards = load_site_shards(SITES_CONFIG_PATH)
+    except (OSError, ValueError) as e:
+        # Configuração inválida: manter os shards atuais em vez de desligar o sharding
+        print(f"Erro ao recarregar configuração de sites: {e}")
+        return {"success": False, "error": str(e), "sites": sorted(site_shards.keys())}
+    site_shards = shards
+    return {"success": True, "sites": sorted(site_shards.keys())}
+
+
 @app.post("/recognize", response_model=RecognizeResponse)
-async def recognize_face(request: RecognizeRequest):
+def recognize_face(request: RecognizeRequest):
     """
     Reconhece uma face na imagem fornecida
     
@@ -217,9 +288,79 @@ class RecognizeWithCollaboratorsRequest(BaseModel):
     colaboradores: list[dict]
 
 
+def search_collaborators(
+    captured_encoding: np.ndarray,
+    colaboradores: list[dict],
+    deadline: Optional[float]
+) -> tuple[Optional[dict], float, bool]:
+    """
+    Compara o encoding capturado com uma lista de colaboradores
+    Retorna (best_match, best_score, partial)
+    """
+    best_match = None
+    best_score = 0.0
+    
+    for colaborador in colaboradores:
+        # Parar se o orçamento de latência acabou
+        remaining = remaining_time(deadline)
+        if remaining is not None and remaining <= 0:
+            print("Deadline da requisição atingido, retornando resultado parcial")
+            return best_match, best_score, True
+
+        foto_url = colaborador.get("foto_url")
+        if not foto_url:
+            continue
+
+        # Extrair path do Nextcloud
+        file_path = extract_nextcloud_path(foto_url)
+        if not file_path:
+            print(f"Não foi possível extrair path da URL: {foto_url}")
+            continue
+
+        # Baixar facial do Nextcloud
+        facial_image_bytes = download_image_from_nextcloud(file_path, deadline)
+        if not facial_image_bytes:
+            print(f"Não foi possível baixar facial do colaborador {colaborador.get('id')}")
+            # Download interrompido pelo deadline: o resultado é parcial mesmo que
+            # este fosse o último colaborador da lista
+            remaining = remaining_time(deadline)
+            if remaining is not None and remaining <= 0:
+                return best_match, best_score, True
+            continue
+
+        # Converter bytes para array numpy
+        try:
+            facial_array = bytes_to_image(facial_image_bytes)
+            if facial_array is None:
+                continue
+        except Exception as e:
+            print(f"Erro ao processar imagem do colaborador {colaborador.get('id')}: {e}")
+            continue
+
+        # Extrair encoding da facial cadastrada
+        stored_encoding = extract_face_encoding(facial_array)
+        if stored_encoding is None:
+            print(f"Não foi possível extrair encoding da facial do colaborador {colaborador.get('id')}")
+            continue
+
+        # Comparar encodings
+        match, score = compare_faces(captured_encoding, stored_encoding, FACE_MATCH_THRESHOLD)
+
+        if match and score > best_score:
+            best_match = colaborador
+            best_score = score
+
+            # Match de alta confiança: não precisa comparar o resto da lista
+            if best_score >= EARLY_EXIT_SCORE:
+                break
+    
+    return best_match, best_score, False
+
+
 @app.post("/recognize-with-collaborators", response_model=RecognizeResponse)
-async def recognize_face_with_collaborators(
-    request: RecognizeWithCollaboratorsRequest
+def recognize_face_with_collaborators(
+    request: RecognizeWithCollaboratorsRequest,
+    x_deadline_ms: Optional[int] = Header(None)
 ):
     """
     Reconhece uma face comparando com lista de colaboradores fornecida
@@ -239,7 +380,12 @@ async def recognize_face_with_collaborators(
             ...
         ]
     }
+
+    O orçamento de latência pode ser informado pelo header X-Deadline-Ms.
+    Se o tempo acabar, retorna o melhor resultado encontrado até então
+    com partial=true.
     """
+    deadline = resolve_deadline(x_deadline_ms, REQUEST_DEADLINE_MS)
     try:
         # Converter base64 para imagem
         image_array = base64_to_image(request.image_base64)
@@ -257,61 +403,37 @@ async def recognize_face_with_collaborators(
                 error="Nenhuma face detectada na imagem. Posicione-se melhor em frente à câmera."
             )
         
-        # Comparar com cada colaborador
-        best_match = None
-        best_score = 0.0
+        # Buscar primeiro no shard do site; se não houver match, buscar nos demais
+        shards = site_shards
+        site = resolve_site(shards, request.dispositivo_info, request.latitude, request.longitude)
+        local, others = split_by_site(shards, request.colaboradores, site)
         
-        for colaborador in request.colaboradores:
-            foto_url = colaborador.get("foto_url")
-            if not foto_url:
-                continue
-            
-            # Extrair path do Nextcloud
-            file_path = extract_nextcloud_path(foto_url)
-            if not file_path:
-                print(f"Não foi possível extrair path da URL: {foto_url}")
-                continue
-            
-            # Baixar facial do Nextcloud
-            facial_image_bytes = download_image_from_nextcloud(file_path)
-            if not facial_image_bytes:
-                print(f"Não foi possível baixar facial do colaborador {colaborador.get('id')}")
-                continue
-            
-            # Converter bytes para array numpy
-            try:
-                facial_image = Image.open(io.BytesIO(facial_image_bytes))
-                if facial_image.mode != "RGB":
-                    facial_image = facial_image.convert("RGB")
-                facial_array = np.array(facial_image)
-            except Exception as e:
-                print(f"Erro ao processar imagem do colaborador {colaborador.get('id')}: {e}")
-                continue
-            
-            # Extrair encoding da facial cadastrada
-            stored_encoding = extract_face_encoding(facial_array)
-            if stored_encoding is None:
-                print(f"Não foi possível extrair encoding da facial do colaborador {colaborador.get('id')}")
-                continue
-            
-            # Comparar encodings
-            match, score = compare_faces(captured_encoding, stored_encoding, FACE_MATCH_THRESHOLD)
-            
-            if match and score > best_score:
-                best_match = colaborador
-                best_score = score
+        best_match, best_score, partial = search_collaborators(captured_encoding, local, deadline)
+        if best_match is None and not partial and others:
+            print(f"Nenhum match no site {site}, buscando nos demais colaboradores")
+            best_match, best_score, partial = search_collaborators(captured_encoding, others, deadline)
         
         if best_match:
             return RecognizeResponse(
                 success=True,
                 colaborador_id=best_match.get("id"),
                 colaborador_nome=best_match.get("nome_completo"),
-                score=best_score
+                score=best_score,
+                partial=partial,
+                site=site
+            )
+        elif partial:
+            return RecognizeResponse(
+                success=False,
+                error="Tempo limite de reconhecimento atingido. Tente novamente.",
+                partial=True,
+                site=site
             )
         else:
             return RecognizeResponse(
                 success=False,
-                error="Colaborador não reconhecido. Verifique se a facial está cadastrada corretamente."
+                error="Colaborador não reconhecido. Verifique se a facial está cadastrada corretamente.",
+                site=site
             )
         
     except Exception as e:
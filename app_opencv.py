@@ -4,22 +4,33 @@ Versão alternativa que não requer dlib ou face_recognition
 """
 
 import os
-import base64
 import io
+import threading
 from typing import Optional
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from dotenv import load_dotenv
+from deadline import remaining_time, resolve_deadline
+from decoding import decode_base64
+from model_pool import ModelPool, configure_native_threads
+from nextcloud import download_with_deadline
+from sites import load_site_shards, resolve_site, split_by_site
+
+# Carregar variáveis de ambiente (antes de ler NATIVE_NUM_THREADS e importar numpy/cv2)
+load_dotenv()
+
+# Threads internas do OpenCV/BLAS por requisição (evita oversubscription,
+# já que as requisições rodam em paralelo no threadpool do FastAPI)
+NATIVE_NUM_THREADS = int(os.getenv("NATIVE_NUM_THREADS", "1"))
+configure_native_threads(NATIVE_NUM_THREADS)
+
 import cv2
 import numpy as np
 from PIL import Image
 import requests
 from requests.auth import HTTPBasicAuth
 
-# Carregar variáveis de ambiente
-load_dotenv()
-
 app = FastAPI(title="Face Recognition Service (OpenCV)", version="1.0.0")
 
 # Configurar CORS
@@ -36,10 +47,30 @@ NEXTCLOUD_WEBDAV_URL = os.getenv("NEXTCLOUD_WEBDAV_URL", "http://192.168.15.10/r
 NEXTCLOUD_USER = os.getenv("NEXTCLOUD_USER", "")
 NEXTCLOUD_PASSWORD = os.getenv("NEXTCLOUD_PASSWORD", "")
 FACE_MATCH_THRESHOLD = float(os.getenv("FACE_MATCH_THRESHOLD", "0.6"))
+NEXTCLOUD_TIMEOUT = float(os.getenv("NEXTCLOUD_TIMEOUT", "10"))
+
+# Orçamento de latência por requisição em milissegundos (0 = sem limite)
+# Pode ser sobrescrito por requisição com o header X-Deadline-Ms
+REQUEST_DEADLINE_MS = int(os.getenv("REQUEST_DEADLINE_MS", "0"))
+# Score a partir do qual a busca para no primeiro match (sem visitar o resto da lista)
+EARLY_EXIT_SCORE = float(os.getenv("EARLY_EXIT_SCORE", "0.9"))
+# Arquivo JSON com o mapeamento site -> dispositivos/geofence/colaboradores
+SITES_CONFIG_PATH = os.getenv("SITES_CONFIG_PATH", "sites.json")
+# Tamanho do pool de modelos (requisições que detectam faces em paralelo por worker)
+MODEL_POOL_SIZE = int(os.getenv("MODEL_POOL_SIZE", str(os.cpu_count() or 1)))
+
+cv2.setNumThreads(NATIVE_NUM_THREADS)
+
+
+def load_face_cascade() -> cv2.CascadeClassifier:
+    """Carrega o detector de faces do OpenCV (Haar Cascade)"""
+    # Não requer opencv-contrib, funciona com opencv-python básico
+    return cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
 
-# Carregar detector de faces do OpenCV (Haar Cascade)
-# Não requer opencv-contrib, funciona com opencv-python básico
-face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+
+# CascadeClassifier não é thread-safe: cada requisição usa uma instância do pool
+detector_pool = ModelPool(load_face_cascade, MODEL_POOL_SIZE, name="haar_cascade")
+detector_pool.add(load_face_cascade())
 
 
 class RecognizeWithCollaboratorsRequest(BaseModel):
@@ -56,6 +87,8 @@ class RecognizeResponse(BaseModel):
     colaborador_nome: Optional[str] = None
     score: Optional[float] = None
     error: Optional[str] = None
+    partial: bool = False
+    site: Optional[str] = None
 
 
 class UploadFacialRequest(BaseModel):
@@ -96,64 +129,51 @@ def extract_nextcloud_path(url: str) -> Optional[str]:
     return None
 
 
-def download_image_from_nextcloud(file_path: str) -> Optional[bytes]:
-    """Baixa uma imagem do Nextcloud"""
-    try:
-        url = f"{NEXTCLOUD_WEBDAV_URL}/{file_path}"
-        response = requests.get(
-            url,
-            auth=HTTPBasicAuth(NEXTCLOUD_USER, NEXTCLOUD_PASSWORD),
-            timeout=10
-        )
-        
-        if response.status_code == 200:
-            return response.content
-        else:
-            print(f"Erro ao baixar imagem do Nextcloud: {response.status_code}")
-            return None
-    except Exception as e:
-        print(f"Exceção ao baixar imagem do Nextcloud: {e}")
-        return None
+def download_image_from_nextcloud(file_path: str, deadline: Optional[float] = None) -> Optional[bytes]:
+    """Baixa uma imagem do Nextcloud respeitando o deadline da requisição"""
+    return download_with_deadline(
+        f"{NEXTCLOUD_WEBDAV_URL}/{file_path}",
+        HTTPBasicAuth(NEXTCLOUD_USER, NEXTCLOUD_PASSWORD),
+        NEXTCLOUD_TIMEOUT,
+        deadline
+    )
+
+
+# Shards de colaboradores por site (recarregável via POST /sites/reload)
+# Configuração inválida impede a inicialização (arquivo inexistente = sem shards)
+site_shards = load_site_shards(SITES_CONFIG_PATH)
+
+
+def bytes_to_image(image_data: bytes) -> Optional[np.ndarray]:
+    """Decodifica os bytes da imagem direto para escala de cinza"""
+    # np.frombuffer cria apenas uma view sobre os bytes (sem cópia) e o
+    # IMREAD_GRAYSCALE evita alocar a imagem colorida e o cvtColor
+    return cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_GRAYSCALE)
 
 
 def base64_to_image(base64_string: str) -> Optional[np.ndarray]:
     """Converte base64 para array numpy (OpenCV)"""
     try:
-        # Remover prefixo data:image se existir
-        if "," in base64_string:
-            base64_string = base64_string.split(",")[1]
-        
-        # Decodificar base64
-        image_data = base64.b64decode(base64_string)
-        
-        # Converter para numpy array
-        nparr = np.frombuffer(image_data, np.uint8)
-        
-        # Decodificar imagem
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if img is None:
-            return None
-        
-        # Converter para escala de cinza
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        
-        return gray
+        return bytes_to_image(decode_base64(base64_string))
     except Exception as e:
         print(f"Erro ao converter base64 para imagem: {e}")
         return None
 
 
-def detect_and_extract_face(image: np.ndarray) -> Optional[np.ndarray]:
-    """Detecta e extrai a face da imagem"""
+def detect_and_extract_face(image: np.ndarray, out: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+    """
+    Detecta e extrai a face da imagem
+    Se out for informado (array 200x200 uint8), a face é escrita nele sem nova alocação
+    """
     try:
         # Detectar faces
-        faces = face_cascade.detectMultiScale(
-            image,
-            scaleFactor=1.1,
-            minNeighbors=5,
-            minSize=(30, 30)
-        )
+        with detector_pool.lease() as face_cascade:
+            faces = face_cascade.detectMultiScale(
+                image,
+                scaleFactor=1.1,
+                minNeighbors=5,
+                minSize=(30, 30)
+            )
         
         if len(faces) == 0:
             return None
@@ -165,7 +185,7 @@ def detect_and_extract_face(image: np.ndarray) -> Optional[np.ndarray]:
         face_roi = image[y:y+h, x:x+w]
         
         # Redimensionar para tamanho padrão (melhora comparação)
-        face_roi = cv2.resize(face_roi, (200, 200))
+        face_roi = cv2.resize(face_roi, (200, 200), dst=out)
         
         return face_roi
     except Exception as e:
@@ -175,6 +195,20 @@ def detect_and_extract_face(image: np.ndarray) -> Optional[np.ndarray]:
 
 
 
+# Buffers 200x200 das faces cadastradas, um por thread do threadpool do FastAPI.
+# Cada requisição roda inteira em uma thread, então o buffer é reaproveitado
+# entre requisições sem ser compartilhado entre buscas simultâneas
+_face_buffers = threading.local()
+
+
+def stored_face_buffer() -> np.ndarray:
+    """Retorna o buffer 200x200 da thread atual, alocando na primeira chamada"""
+    buffer = getattr(_face_buffers, "face", None)
+    if buffer is None:
+        buffer = _face_buffers.face = np.empty((200, 200), np.uint8)
+    return buffer
+
+
 def compare_faces_opencv(captured_face: np.ndarray, stored_face: np.ndarray) -> tuple[bool, float]:
     """
     Compara duas faces usando histograma e correlação
@@ -215,14 +249,112 @@ async def root():
     return {"status": "ok", "service": "face-recognition-opencv"}
 
 
+def search_collaborators(
+    captured_face: np.ndarray,
+    colaboradores: list[dict],
+    deadline: Optional[float]
+) -> tuple[Optional[dict], float, bool]:
+    """
+    Compara a face capturada com uma lista de colaboradores
+    Retorna (best_match, best_score, partial)
+    """
+    best_match = None
+    best_score = 0.0
+    
+    # Buffer reaproveitado para a face de cada colaborador (alocado uma vez por thread)
+    stored_buffer = stored_face_buffer()
+    
+    for colaborador in colaboradores:
+        # Parar se o orçamento de latência acabou
+        remaining = remaining_time(deadline)
+        if remaining is not None and remaining <= 0:
+            print("Deadline da requisição atingido, retornando resultado parcial")
+            return best_match, best_score, True
+
+        foto_url = colaborador.get("foto_url")
+        if not foto_url:
+            continue
+
+        # Extrair path do Nextcloud
+        file_path = extract_nextcloud_path(foto_url)
+        if not file_path:
+            print(f"Não foi possível extrair path da URL: {foto_url}")
+            continue
+
+        # Baixar facial do Nextcloud
+        facial_image_bytes = download_image_from_nextcloud(file_path, deadline)
+        if not facial_image_bytes:
+            print(f"Não foi possível baixar facial do colaborador {colaborador.get('id')}")
+            # Download interrompido pelo deadline: o resultado é parcial mesmo que
+            # este fosse o último colaborador da lista
+            remaining = remaining_time(deadline)
+            if remaining is not None and remaining <= 0:
+                return best_match, best_score, True
+            continue
+
+        # Decodificar bytes direto para escala de cinza
+        try:
+            facial_gray = bytes_to_image(facial_image_bytes)
+            if facial_gray is None:
+                continue
+        except Exception as e:
+            print(f"Erro ao processar imagem do colaborador {colaborador.get('id')}: {e}")
+            continue
+
+        # Detectar e extrair face da facial cadastrada
+        stored_face = detect_and_extract_face(facial_gray, out=stored_buffer)
+        # Liberar a imagem antes de baixar/decodificar a próxima (só a face 200x200 é usada)
+        del facial_gray, facial_image_bytes
+        if stored_face is None:
+            print(f"Não foi possível detectar face na facial do colaborador {colaborador.get('id')}")
+            continue
+
+        # Comparar faces
+        match, score = compare_faces_opencv(captured_face, stored_face)
+
+        print(f"Colaborador {colaborador.get('id')}: match={match}, score={score:.3f}")
+
+        if match and score > best_score:
+            best_match = colaborador
+            best_score = score
+
+            # Match de alta confiança: não precisa comparar o resto da lista
+            if best_score >= EARLY_EXIT_SCORE:
+                break
+    
+    return best_match, best_score, False
+
+
+@app.get("/metrics")
+async def metrics():
+    """Utilização do pool de modelos"""
+    return {"pools": [detector_pool.metrics()]}
+
+
+@app.post("/sites/reload")
+async def reload_sites():
+    """Recarrega o mapeamento de sites (shards) sem reiniciar o serviço"""
+    global site_shards
+    try:
+        shards = load_site_shards(SITES_CONFIG_PATH)
+    except (OSError, ValueError) as e:
+        # Configuração inválida: manter os shards atuais em vez de desligar o sharding
+        print(f"Erro ao recarregar configuração de sites: {e}")
+        return {"success": False, "error": str(e), "sites": sorted(site_shards.keys())}
+    site_shards = shards
+    return {"success": True, "sites": sorted(site_shards.keys())}
+
+
 @app.post("/recognize-with-collaborators", response_model=RecognizeResponse)
-async def recognize_face_with_collaborators(
-    request: RecognizeWithCollaboratorsRequest
+def recognize_face_with_collaborators(
+    request: RecognizeWithCollaboratorsRequest,
+    x_deadline_ms: Optional[int] = Header(None)
 ):
     """
     Reconhece uma face comparando com lista de colaboradores fornecida
     Usa OpenCV sem dependência de dlib
     """
+    deadline = resolve_deadline(x_deadline_ms, REQUEST_DEADLINE_MS)
     try:
         # Converter base64 para imagem
         captured_image = base64_to_image(request.image_base64)
@@ -240,64 +372,37 @@ async def recognize_face_with_collaborators(
                 error="Nenhuma face detectada na imagem. Posicione-se melhor em frente à câmera."
             )
         
-        # Comparar com cada colaborador
-        best_match = None
-        best_score = 0.0
+        # Buscar primeiro no shard do site; se não houver match, buscar nos demais
+        shards = site_shards
+        site = resolve_site(shards, request.dispositivo_info, request.latitude, request.longitude)
+        local, others = split_by_site(shards, request.colaboradores, site)
         
-        for colaborador in request.colaboradores:
-            foto_url = colaborador.get("foto_url")
-            if not foto_url:
-                continue
-            
-            # Extrair path do Nextcloud
-            file_path = extract_nextcloud_path(foto_url)
-            if not file_path:
-                print(f"Não foi possível extrair path da URL: {foto_url}")
-                continue
-            
-            # Baixar facial do Nextcloud
-            facial_image_bytes = download_image_from_nextcloud(file_path)
-            if not facial_image_bytes:
-                print(f"Não foi possível baixar facial do colaborador {colaborador.get('id')}")
-                continue
-            
-            # Converter bytes para array numpy
-            try:
-                nparr = np.frombuffer(facial_image_bytes, np.uint8)
-                facial_image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-                if facial_image is None:
-                    continue
-                facial_gray = cv2.cvtColor(facial_image, cv2.COLOR_BGR2GRAY)
-            except Exception as e:
-                print(f"Erro ao processar imagem do colaborador {colaborador.get('id')}: {e}")
-                continue
-            
-            # Detectar e extrair face da facial cadastrada
-            stored_face = detect_and_extract_face(facial_gray)
-            if stored_face is None:
-                print(f"Não foi possível detectar face na facial do colaborador {colaborador.get('id')}")
-                continue
-            
-            # Comparar faces
-            match, score = compare_faces_opencv(captured_face, stored_face)
-            
-            print(f"Colaborador {colaborador.get('id')}: match={match}, score={score:.3f}")
-            
-            if match and score > best_score:
-                best_match = colaborador
-                best_score = score
+        best_match, best_score, partial = search_collaborators(captured_face, local, deadline)
+        if best_match is None and not partial and others:
+            print(f"Nenhum match no site {site}, buscando nos demais colaboradores")
+            best_match, best_score, partial = search_collaborators(captured_face, others, deadline)
         
         if best_match:
             return RecognizeResponse(
                 success=True,
                 colaborador_id=best_match.get("id"),
                 colaborador_nome=best_match.get("nome_completo"),
-                score=best_score
+                score=best_score,
+                partial=partial,
+                site=site
+            )
+        elif partial:
+            return RecognizeResponse(
+                success=False,
+                error="Tempo limite de reconhecimento atingido. Tente novamente.",
+                partial=True,
+                site=site
             )
         else:
             return RecognizeResponse(
                 success=False,
-                error="Colaborador não reconhecido. Verifique se a facial está cadastrada corretamente."
+                error="Colaborador não reconhecido. Verifique se a facial está cadastrada corretamente.",
+                site=site
             )
         
     except Exception as e:
@@ -345,15 +450,21 @@ def upload_image_to_nextcloud(file_path: str, image_bytes: bytes) -> Optional[st
 
 
 @app.post("/upload-facial", response_model=UploadFacialResponse)
-async def upload_facial(request: UploadFacialRequest):
+def upload_facial(request: UploadFacialRequest):
     """
     Faz upload de uma facial para o Nextcloud
     
     Valida que a imagem contém uma face detectável antes de fazer upload
     """
     try:
-        # Converter base64 para imagem
-        image_array = base64_to_image(request.image_base64)
+        # Decodificar base64 uma única vez: os mesmos bytes são validados e enviados
+        try:
+            image_data = decode_base64(request.image_base64)
+            image_array = bytes_to_image(image_data)
+        except Exception as e:
+            print(f"Erro ao converter base64 para imagem: {e}")
+            image_array = None
+        
         if image_array is None:
             return UploadFacialResponse(
                 success=False,
@@ -368,26 +479,6 @@ async def upload_facial(request: UploadFacialRequest):
                 error="Nenhuma face detectada na imagem. Por favor, tire uma foto onde sua face esteja claramente visível."
             )
         
-        # Converter imagem de volta para bytes (JPEG)
-        # Usar a imagem original (colorida) para upload
-        try:
-            # Decodificar base64 novamente para pegar imagem original
-            if "," in request.image_base64:
-                base64_string = request.image_base64.split(",")[1]
-            else:
-                base64_string = request.image_base64
-            
-            image_data = base64.b64decode(base64_string)
-            
-            # Opcional: redimensionar/otimizar imagem aqui se necessário
-            
-        except Exception as e:
-            print(f"Erro ao processar imagem para upload: {e}")
-            return UploadFacialResponse(
-                success=False,
-                error="Erro ao processar imagem para upload."
-            )
-        
         # Gerar nome do arquivo
         import time
         timestamp = int(time.time() * 1000)
@@ -0,0 +1,25 @@
+"""
+Orçamento de latência por requisição
+Compartilhado por app.py e app_opencv.py
+"""
+
+import time
+from typing import Optional
+
+
+def resolve_deadline(deadline_ms: Optional[int], default_ms: int = 0) -> Optional[float]:
+    """
+    Calcula o instante limite (time.monotonic) da requisição
+    Usa o header X-Deadline-Ms se informado, senão default_ms (0 = sem limite)
+    """
+    budget_ms = deadline_ms if deadline_ms is not None else default_ms
+    if budget_ms <= 0:
+        return None
+    return time.monotonic() + budget_ms / 1000.0
+
+
+def remaining_time(deadline: Optional[float]) -> Optional[float]:
+    """Retorna os segundos restantes até o deadline (None = sem limite)"""
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
@@ -0,0 +1,18 @@
+"""
+Decodificação do base64 enviado pelo Next.js
+Compartilhado por app.py e app_opencv.py
+"""
+
+import binascii
+
+
+def decode_base64(base64_string: str) -> bytes:
+    """Decodifica o base64 da requisição (com ou sem prefixo data:image)"""
+    start = base64_string.find(",") + 1
+    if not start:
+        # Sem prefixo: a2b_base64 lê direto o buffer ASCII da string, sem cópia
+        return binascii.a2b_base64(base64_string)
+    
+    # Com prefixo: uma única cópia (encode) e decodificação a partir do offset,
+    # sem fatiar a string nem passar pelo encode interno do base64.b64decode
+    return binascii.a2b_base64(memoryview(base64_string.encode("ascii"))[start:])
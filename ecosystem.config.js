@@ -11,6 +11,7 @@ module.exports = {
         API_HOST: '0.0.0.0',
         API_PORT: '9090',
         FACE_MATCH_THRESHOLD: '0.6',
+        NATIVE_NUM_THREADS: '1',
       },
       env_file: '.env',
       error_file: './logs/err.log',
@@ -0,0 +1,388 @@
+"""
+Gerador de carga para o Serviço de Reconhecimento Facial
+Reproduz tráfego de troca de turno contra /recognize-with-collaborators e /upload-facial
+
+Uso:
+    python loadtest/load_generator.py run --image probe.jpg --label opencv --output opencv.json
+    python loadtest/load_generator.py compare app.json opencv.json
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import random
+import asyncio
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+import requests
+from requests.adapters import HTTPAdapter
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+# Respostas 200 com estes erros são resultados de negócio esperados (não contam como erro)
+EXPECTED_ERRORS = (
+    "Nenhuma face detectada",
+    "Colaborador não reconhecido",
+    "Tempo limite de reconhecimento",
+)
+
+
+def load_image_base64(path: str) -> str:
+    """Lê uma imagem e devolve no formato data URL enviado pelo Next.js"""
+    with open(path, "rb") as f:
+        encoded = base64.b64encode(f.read()).decode("ascii")
+    return f"data:image/jpeg;base64,{encoded}"
+
+
+def build_colaboradores(count: int) -> list[dict]:
+    """Monta a lista de colaboradores apontando para o stub do WebDAV"""
+    return [
+        {
+            "id": str(i),
+            "nome_completo": f"Colaborador {i}",
+            "foto_url": f"/api/nextcloud/image?path=colaboradores/{i}/facial_1.jpg",
+        }
+        for i in range(1, count + 1)
+    ]
+
+
+def arrival_rate(pattern: str, rate: float, peak_rate: float, elapsed: float, duration: float) -> float:
+    """
+    Taxa de chegada (req/s) no instante elapsed
+
+    constant: taxa fixa
+    poisson: taxa fixa com intervalos exponenciais
+    shift: rampa triangular até peak_rate no meio do teste (troca de turno)
+    """
+    if pattern == "shift":
+        progress = elapsed / duration if duration > 0 else 0.0
+        triangle = 1.0 - abs(2.0 * progress - 1.0)
+        return rate + (peak_rate - rate) * triangle
+    return rate
+
+
+def next_interval(pattern: str, current_rate: float) -> float:
+    """Intervalo até a próxima chegada"""
+    if current_rate <= 0:
+        return 1.0
+    if pattern in ("poisson", "shift"):
+        return random.expovariate(current_rate)
+    return 1.0 / current_rate
+
+
+def read_process_stats(pid: int) -> Optional[dict]:
+    """Lê CPU acumulada (segundos) e RSS (bytes) de /proc (somente Linux)"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        # Campos após o nome do processo: state=0, ppid=1, utime=11, stime=12, rss=21
+        cpu_seconds = (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+        rss_bytes = int(fields[21]) * PAGE_SIZE
+        return {"ppid": int(fields[1]), "cpu_seconds": cpu_seconds, "rss_bytes": rss_bytes}
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def find_worker_pids(pids: list[int]) -> list[int]:
+    """Inclui os processos filhos (workers do uvicorn/gunicorn) dos PIDs informados"""
+    workers = set(pids)
+    if not os.path.isdir("/proc"):
+        return sorted(workers)
+
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        stats = read_process_stats(int(name))
+        if stats and stats["ppid"] in pids:
+            workers.add(int(name))
+    return sorted(workers)
+
+
+class ResourceSampler:
+    """Amostra CPU e RSS dos workers do serviço durante o teste"""
+
+    def __init__(self, pids: list[int], interval: float = 1.0):
+        self.pids = find_worker_pids(pids) if pids else []
+        self.interval = interval
+        self.samples: dict[int, list[dict]] = {pid: [] for pid in self.pids}
+
+    async def run(self, stop: asyncio.Event):
+        while not stop.is_set():
+            now = time.monotonic()
+            for pid in self.pids:
+                stats = read_process_stats(pid)
+                if stats:
+                    stats["time"] = now
+                    self.samples[pid].append(stats)
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def report(self) -> dict:
+        workers = {}
+        for pid, samples in self.samples.items():
+            if len(samples) < 2:
+                continue
+            wall = samples[-1]["time"] - samples[0]["time"]
+            cpu = samples[-1]["cpu_seconds"] - samples[0]["cpu_seconds"]
+            workers[str(pid)] = {
+                "cpu_percent": round(100.0 * cpu / wall, 1) if wall > 0 else 0.0,
+                "rss_mb_max": round(max(s["rss_bytes"] for s in samples) / 2**20, 1),
+                "rss_mb_avg": round(statistics.mean(s["rss_bytes"] for s in samples) / 2**20, 1),
+            }
+        return workers
+
+
+def is_error(status: int, body: dict) -> bool:
+    """Erro = status diferente de 200 ou 200 com erro que não é um resultado esperado"""
+    if status != 200:
+        return True
+    error = body.get("error")
+    return bool(error) and not error.startswith(EXPECTED_ERRORS)
+
+
+def percentile(values: list[float], pct: float) -> Optional[float]:
+    """Percentil por interpolação linear"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100.0
+    lower = int(k)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+
+def percentile_ms(values: list[float], pct: float) -> Optional[float]:
+    """Percentil arredondado em ms (None sem amostras, em vez de um 0.0 enganoso)"""
+    value = percentile(values, pct)
+    return None if value is None else round(value, 1)
+
+
+def format_value(value, unit: str = "") -> str:
+    return "-" if value is None else f"{value}{unit}"
+
+
+class LoadGenerator:
+    """Dispara requisições em malha aberta conforme o padrão de chegada"""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=args.max_in_flight,
+            pool_maxsize=args.max_in_flight
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers=args.max_in_flight)
+        self.image_base64 = load_image_base64(args.image)
+        self.colaboradores = build_colaboradores(args.colaboradores)
+        self.results: list[dict] = []
+        self.dropped = 0
+        self.in_flight = 0
+
+    def send(self, endpoint: str) -> dict:
+        """Executa uma requisição (bloqueante, roda no executor)"""
+        if endpoint == "upload":
+            url = f"{self.args.url}/upload-facial"
+            payload = {
+                "colaborador_id": str(random.randint(1, self.args.colaboradores)),
+                "image_base64": self.image_base64,
+            }
+        else:
+            url = f"{self.args.url}/recognize-with-collaborators"
+            payload = {
+                "image_base64": self.image_base64,
+                "dispositivo_info": self.args.dispositivo,
+                "colaboradores": self.colaboradores,
+            }
+
+        headers = {}
+        if self.args.deadline_ms:
+            headers["X-Deadline-Ms"] = str(self.args.deadline_ms)
+
+        start = time.perf_counter()
+        try:
+            response = self.session.post(url, json=payload, headers=headers, timeout=self.args.timeout)
+            latency = time.perf_counter() - start
+            body = response.json() if response.status_code == 200 else {}
+            return {
+                "endpoint": endpoint,
+                "latency": latency,
+                "status": response.status_code,
+                "error": is_error(response.status_code, body),
+                "success": bool(body.get("success")),
+                "partial": bool(body.get("partial")),
+            }
+        except Exception as e:
+            return {
+                "endpoint": endpoint,
+                "latency": time.perf_counter() - start,
+                "status": None,
+                "error": True,
+                "success": False,
+                "partial": False,
+                "exception": type(e).__name__,
+            }
+
+    async def fire(self, endpoint: str):
+        loop = asyncio.get_running_loop()
+        self.in_flight += 1
+        try:
+            result = await loop.run_in_executor(self.executor, self.send, endpoint)
+            self.results.append(result)
+        finally:
+            self.in_flight -= 1
+
+    async def run(self) -> dict:
+        args = self.args
+        stop = asyncio.Event()
+        sampler = ResourceSampler(args.pid)
+        sampler_task = asyncio.create_task(sampler.run(stop))
+
+        tasks = []
+        start = time.monotonic()
+        elapsed = 0.0
+        while elapsed < args.duration:
+            if self.in_flight >= args.max_in_flight:
+                # Servidor saturado: contabilizar em vez de enfileirar sem limite
+                self.dropped += 1
+            else:
+                endpoint = "upload" if random.random() < args.upload_ratio else "recognize"
+                tasks.append(asyncio.create_task(self.fire(endpoint)))
+
+            current_rate = arrival_rate(args.pattern, args.rate, args.peak_rate, elapsed, args.duration)
+            await asyncio.sleep(next_interval(args.pattern, current_rate))
+            elapsed = time.monotonic() - start
+
+        await asyncio.gather(*tasks)
+        wall = time.monotonic() - start
+        stop.set()
+        await sampler_task
+        self.executor.shutdown()
+
+        return self.report(wall, sampler.report())
+
+    def report(self, wall: float, workers: dict) -> dict:
+        endpoints = {}
+        for endpoint in ("recognize", "upload"):
+            results = [r for r in self.results if r["endpoint"] == endpoint]
+            if not results:
+                continue
+            # Percentis sobre todas as requisições concluídas: timeouts e 5xx são
+            # justamente a cauda da sobrecarga; os erros também saem separados
+            latencies = [r["latency"] * 1000 for r in results]
+            error_latencies = [r["latency"] * 1000 for r in results if r["error"]]
+            errors = len(error_latencies)
+            endpoints[endpoint] = {
+                "requests": len(results),
+                "throughput_rps": round(len(results) / wall, 2),
+                "p50_ms": percentile_ms(latencies, 50),
+                "p95_ms": percentile_ms(latencies, 95),
+                "p99_ms": percentile_ms(latencies, 99),
+                "error_p50_ms": percentile_ms(error_latencies, 50),
+                "error_p99_ms": percentile_ms(error_latencies, 99),
+                "error_rate": round(errors / len(results), 4),
+                "recognized_rate": round(sum(1 for r in results if r["success"]) / len(results), 4),
+                "partial_rate": round(sum(1 for r in results if r["partial"]) / len(results), 4),
+            }
+
+        return {
+            "label": self.args.label,
+            "url": self.args.url,
+            "pattern": self.args.pattern,
+            "duration_s": round(wall, 1),
+            "colaboradores": self.args.colaboradores,
+            "dropped": self.dropped,
+            "endpoints": endpoints,
+            "workers": workers,
+        }
+
+
+def print_report(report: dict):
+    print(f"\n=== {report['label']} ({report['url']}, padrão {report['pattern']}, {report['duration_s']}s) ===")
+    for endpoint, stats in report["endpoints"].items():
+        print(f"{endpoint}: {stats['requests']} req, {stats['throughput_rps']} req/s, "
+              f"p50={format_value(stats['p50_ms'], 'ms')} p95={format_value(stats['p95_ms'], 'ms')} "
+              f"p99={format_value(stats['p99_ms'], 'ms')}, "
+              f"erros={stats['error_rate']:.1%} (p50={format_value(stats['error_p50_ms'], 'ms')} "
+              f"p99={format_value(stats['error_p99_ms'], 'ms')}), reconhecidos={stats['recognized_rate']:.1%}, "
+              f"parciais={stats['partial_rate']:.1%}")
+    if report["dropped"]:
+        print(f"Chegadas descartadas (max-in-flight atingido): {report['dropped']}")
+    for pid, stats in report["workers"].items():
+        print(f"worker {pid}: CPU={stats['cpu_percent']}% RSS max={stats['rss_mb_max']}MB avg={stats['rss_mb_avg']}MB")
+
+
+def compare_reports(paths: list[str]):
+    """Tabela lado a lado de relatórios (ex.: app.py x app_opencv.py)"""
+    reports = []
+    for path in paths:
+        with open(path) as f:
+            reports.append(json.load(f))
+
+    metrics = ["requests", "throughput_rps", "p50_ms", "p95_ms", "p99_ms", "error_p50_ms", "error_p99_ms",
+               "error_rate", "recognized_rate", "partial_rate"]
+    labels = [r["label"] for r in reports]
+    print(f"{'métrica':<28}" + "".join(f"{label:>16}" for label in labels))
+
+    endpoints = sorted({e for r in reports for e in r["endpoints"]})
+    for endpoint in endpoints:
+        for metric in metrics:
+            values = [r["endpoints"].get(endpoint, {}).get(metric) for r in reports]
+            print(f"{endpoint + '.' + metric:<28}" + "".join(f"{format_value(v):>16}" for v in values))
+
+    cpu = [round(sum(w["cpu_percent"] for w in r["workers"].values()), 1) for r in reports]
+    rss = [round(sum(w["rss_mb_max"] for w in r["workers"].values()), 1) for r in reports]
+    print(f"{'workers.cpu_percent':<28}" + "".join(f"{v:>16}" for v in cpu))
+    print(f"{'workers.rss_mb_max':<28}" + "".join(f"{v:>16}" for v in rss))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gerador de carga do serviço de reconhecimento facial")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run = subparsers.add_parser("run", help="Executa um teste de carga")
+    run.add_argument("--url", default="http://127.0.0.1:9090", help="URL do serviço")
+    run.add_argument("--image", required=True, help="Imagem enviada como captura do totem")
+    run.add_argument("--label", default="app", help="Nome do backend no relatório")
+    run.add_argument("--duration", type=float, default=60.0, help="Duração em segundos")
+    run.add_argument("--pattern", choices=["constant", "poisson", "shift"], default="poisson")
+    run.add_argument("--rate", type=float, default=2.0, help="Taxa de chegada base (req/s)")
+    run.add_argument("--peak-rate", type=float, default=10.0, help="Pico da troca de turno (padrão shift)")
+    run.add_argument("--upload-ratio", type=float, default=0.05, help="Fração de requisições /upload-facial")
+    run.add_argument("--colaboradores", type=int, default=50, help="Tamanho da lista de colaboradores")
+    run.add_argument("--dispositivo", default=None, help="dispositivo_info enviado nas requisições")
+    run.add_argument("--deadline-ms", type=int, default=0, help="Header X-Deadline-Ms (0 = não enviar)")
+    run.add_argument("--max-in-flight", type=int, default=64, help="Limite de requisições simultâneas")
+    run.add_argument("--timeout", type=float, default=120.0, help="Timeout HTTP por requisição")
+    run.add_argument("--pid", type=int, action="append", default=[],
+                     help="PID do serviço (repetível); workers filhos são incluídos")
+    run.add_argument("--output", help="Salvar relatório em JSON")
+
+    compare = subparsers.add_parser("compare", help="Compara relatórios JSON")
+    compare.add_argument("reports", nargs="+")
+
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        compare_reports(args.reports)
+        return
+
+    report = asyncio.run(LoadGenerator(args).run())
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Relatório salvo em {args.output}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""
+Stub local do WebDAV do Nextcloud para testes de carga
+Serve colaboradores/<id>/facial_*.jpg com latência e taxa de erro configuráveis
+"""
+
+import os
+import asyncio
+import random
+import argparse
+from typing import Optional
+from fastapi import FastAPI, Request, Response
+
+app = FastAPI(title="Nextcloud WebDAV Stub", version="1.0.0")
+
+# Configurações (sobrescritas pelos argumentos de linha de comando)
+FACES_DIR = os.getenv("STUB_FACES_DIR", "faces")
+LATENCY_MS = float(os.getenv("STUB_LATENCY_MS", "50"))
+JITTER_MS = float(os.getenv("STUB_JITTER_MS", "20"))
+ERROR_RATE = float(os.getenv("STUB_ERROR_RATE", "0.0"))
+
+# Faciais enviadas via PUT (mantidas em memória)
+uploaded_files: dict[str, bytes] = {}
+
+
+def load_face_files(faces_dir: str) -> list[str]:
+    """Lista as imagens disponíveis para servir como faciais cadastradas"""
+    if not os.path.isdir(faces_dir):
+        return []
+    return sorted(
+        os.path.join(faces_dir, name)
+        for name in os.listdir(faces_dir)
+        if name.lower().endswith((".jpg", ".jpeg", ".png"))
+    )
+
+
+face_files = load_face_files(FACES_DIR)
+
+
+def face_for_path(file_path: str) -> Optional[bytes]:
+    """Escolhe a imagem servida para colaboradores/<id>/facial_*.jpg"""
+    if file_path in uploaded_files:
+        return uploaded_files[file_path]
+
+    if not face_files:
+        return None
+
+    parts = file_path.split("/")
+    if len(parts) < 3 or parts[0] != "colaboradores":
+        return None
+
+    # Mesmo colaborador sempre recebe a mesma imagem
+    colaborador_id = parts[1]
+    index = sum(colaborador_id.encode()) % len(face_files)
+    with open(face_files[index], "rb") as f:
+        return f.read()
+
+
+async def inject_latency_and_errors() -> Optional[Response]:
+    """Simula a latência do Nextcloud e devolve um erro 503 conforme ERROR_RATE"""
+    delay = max(0.0, random.gauss(LATENCY_MS, JITTER_MS)) / 1000.0
+    await asyncio.sleep(delay)
+
+    if random.random() < ERROR_RATE:
+        return Response(status_code=503)
+    return None
+
+
+@app.get("/")
+async def root():
+    """Endpoint de health check"""
+    return {
+        "status": "ok",
+        "service": "webdav-stub",
+        "faces": len(face_files),
+        "uploaded": len(uploaded_files),
+    }
+
+
+@app.get("/remote.php/dav/files/{user}/{file_path:path}")
+async def get_file(user: str, file_path: str):
+    """Download de uma facial"""
+    error = await inject_latency_and_errors()
+    if error:
+        return error
+
+    content = face_for_path(file_path)
+    if content is None:
+        return Response(status_code=404)
+    return Response(content=content, media_type="image/jpeg")
+
+
+@app.put("/remote.php/dav/files/{user}/{file_path:path}")
+async def put_file(user: str, file_path: str, request: Request):
+    """Upload de uma facial"""
+    error = await inject_latency_and_errors()
+    if error:
+        return error
+
+    uploaded_files[file_path] = await request.body()
+    return Response(status_code=201)
+
+
+@app.api_route("/remote.php/dav/files/{user}/{file_path:path}", methods=["MKCOL"])
+async def make_collection(user: str, file_path: str):
+    """Criação de diretório (sempre aceita)"""
+    return Response(status_code=201)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Stub do WebDAV do Nextcloud")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--faces-dir", default=FACES_DIR, help="Diretório com imagens de faces")
+    parser.add_argument("--latency-ms", type=float, default=LATENCY_MS, help="Latência média por requisição")
+    parser.add_argument("--jitter-ms", type=float, default=JITTER_MS, help="Desvio padrão da latência")
+    parser.add_argument("--error-rate", type=float, default=ERROR_RATE, help="Fração de respostas 503 (0.0 a 1.0)")
+    args = parser.parse_args()
+
+    FACES_DIR = args.faces_dir
+    LATENCY_MS = args.latency_ms
+    JITTER_MS = args.jitter_ms
+    ERROR_RATE = args.error_rate
+    face_files = load_face_files(FACES_DIR)
+
+    print(f"Servindo {len(face_files)} faces de {FACES_DIR} "
+          f"(latência {LATENCY_MS}±{JITTER_MS} ms, erros {ERROR_RATE:.0%})")
+    uvicorn.run(app, host=args.host, port=args.port)
@@ -0,0 +1,115 @@
+"""
+Pool de modelos de detecção/encoding facial
+Cada requisição recebe uma instância exclusiva, pois cv2.CascadeClassifier
+e os modelos do dlib não são seguros para uso simultâneo entre threads
+"""
+
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable
+
+
+def configure_native_threads(num_threads: int):
+    """
+    Limita as threads internas de BLAS/OpenMP
+    Precisa ser chamado antes de importar numpy, cv2 ou dlib
+    """
+    for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ.setdefault(var, str(num_threads))
+
+
+class ModelPool:
+    """Pool de instâncias de modelo criadas sob demanda até o tamanho máximo"""
+
+    def __init__(self, factory: Callable[[], Any], size: int, name: str = "model"):
+        self.factory = factory
+        self.size = max(1, size)
+        self.name = name
+        self._available = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._leases = 0
+        self._waits = 0
+        self._wait_seconds = 0.0
+        # Tempo total com instâncias emprestadas: leases encerrados + início dos em andamento
+        self._busy_seconds = 0.0
+        self._busy_started = 0.0
+
+    def add(self, instance: Any):
+        """Adiciona uma instância já carregada (ex.: modelos carregados no import)"""
+        with self._lock:
+            if self._created >= self.size:
+                return
+            self._created += 1
+        self._available.put(instance)
+
+    def _acquire(self) -> Any:
+        try:
+            return self._available.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            create = self._created < self.size
+            if create:
+                self._created += 1
+
+        if create:
+            try:
+                return self.factory()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        # Pool esgotado: aguardar uma instância ser devolvida
+        start = time.monotonic()
+        instance = self._available.get()
+        with self._lock:
+            self._waits += 1
+            self._wait_seconds += time.monotonic() - start
+        return instance
+
+    @contextmanager
+    def lease(self):
+        """Empresta uma instância exclusiva durante o bloco with"""
+        instance = self._acquire()
+        start = time.monotonic()
+        with self._lock:
+            self._in_use += 1
+            self._leases += 1
+            self._busy_started += start
+        try:
+            yield instance
+        finally:
+            end = time.monotonic()
+            with self._lock:
+                self._in_use -= 1
+                self._busy_started -= start
+                self._busy_seconds += end - start
+            self._available.put(instance)
+
+    def metrics(self) -> dict:
+        """
+        Utilização do pool (exportada em GET /metrics)
+        utilization é instantânea; a utilização média entre duas leituras é
+        Δbusy_seconds_total / (Δtempo * size)
+        """
+        with self._lock:
+            now = time.monotonic()
+            busy_seconds = self._busy_seconds + self._in_use * now - self._busy_started
+            return {
+                "name": self.name,
+                "size": self.size,
+                "created": self._created,
+                "in_use": self._in_use,
+                "utilization": round(self._in_use / self.size, 3),
+                "busy_seconds_total": round(busy_seconds, 3),
+                "leases": self._leases,
+                "waits": self._waits,
+                "wait_seconds_total": round(self._wait_seconds, 3),
+            }
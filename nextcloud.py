@@ -0,0 +1,51 @@
+"""
+Download de faciais do Nextcloud com orçamento de latência
+Compartilhado por app.py e app_opencv.py
+"""
+
+from typing import Any, Optional
+import requests
+
+from deadline import remaining_time
+
+CHUNK_SIZE = 64 * 1024
+
+
+def download_with_deadline(
+    url: str,
+    auth: Any,
+    timeout: float,
+    deadline: Optional[float] = None
+) -> Optional[bytes]:
+    """Baixa um arquivo via WebDAV respeitando o deadline da requisição (None em erro ou sem tempo)"""
+    try:
+        remaining = remaining_time(deadline)
+        read_timeout = timeout if remaining is None else min(timeout, remaining)
+        if read_timeout <= 0:
+            return None
+
+        # O timeout do requests vale por operação de socket, não para o download inteiro.
+        # Com stream=True o deadline é verificado a cada leitura, então um servidor
+        # lento só pode ultrapassar o orçamento pelo tempo de uma leitura (no máximo read_timeout)
+        with requests.get(url, auth=auth, timeout=read_timeout, stream=True) as response:
+            if response.status_code != 200:
+                print(f"Erro ao baixar imagem do Nextcloud: {response.status_code}")
+                return None
+
+            # read1 devolve o que já chegou no socket, sem esperar completar o chunk
+            # (urllib3 antigo sem read1 espera o chunk inteiro)
+            read = getattr(response.raw, "read1", None) or response.raw.read
+            chunks = []
+            while True:
+                chunk = read(CHUNK_SIZE, decode_content=True)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                remaining = remaining_time(deadline)
+                if remaining is not None and remaining <= 0:
+                    print(f"Deadline atingido durante o download de {url}")
+                    return None
+            return b"".join(chunks)
+    except Exception as e:
+        print(f"Exceção ao baixar imagem do Nextcloud: {e}")
+        return None
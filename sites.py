@@ -0,0 +1,142 @@
+"""
+Shards de colaboradores por site (dispositivo ou geofence)
+Compartilhado por app.py e app_opencv.py
+"""
+
+import os
+import json
+import math
+from typing import Optional
+
+
+def load_site_shards(path: str) -> dict:
+    """
+    Carrega o mapeamento de sites a partir de um arquivo JSON
+
+    Formato:
+    {
+        "sites": {
+            "matriz": {
+                "dispositivos": ["totem-01", "totem-02"],
+                "geofence": {"latitude": -23.5505, "longitude": -46.6333, "raio_metros": 300},
+                "colaboradores": ["id1", "id2"]
+            }
+        }
+    }
+
+    Arquivo inexistente = sem shards ({}). JSON inválido ou fora do formato
+    levanta ValueError, para que um erro de digitação não desligue o sharding
+    """
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        # json.JSONDecodeError é subclasse de ValueError
+        config = json.load(f)
+
+    sites = config.get("sites") if isinstance(config, dict) else None
+    if not isinstance(sites, dict):
+        raise ValueError(f"{path}: 'sites' deve ser um objeto {{nome: site}}")
+
+    shards = {}
+    for name, site in sites.items():
+        if not isinstance(site, dict):
+            raise ValueError(f"Site {name}: esperado um objeto")
+        dispositivos = site.get("dispositivos", [])
+        colaboradores = site.get("colaboradores", [])
+        # Uma string aqui viraria um set de caracteres ("totem-01" -> {"t", "o", ...})
+        if not isinstance(dispositivos, list):
+            raise ValueError(f"Site {name}: 'dispositivos' deve ser uma lista")
+        if not isinstance(colaboradores, list):
+            raise ValueError(f"Site {name}: 'colaboradores' deve ser uma lista")
+        shards[name] = {
+            "dispositivos": {str(d) for d in dispositivos},
+            "geofence": parse_geofence(name, site.get("geofence")),
+            "colaboradores": {str(c) for c in colaboradores},
+        }
+    return shards
+
+
+def parse_geofence(site_name: str, geofence) -> Optional[dict]:
+    """Valida a geofence de um site; inválida é ignorada (o site continua valendo pelo dispositivo)"""
+    if geofence is None:
+        return None
+    try:
+        parsed = {
+            "latitude": float(geofence["latitude"]),
+            "longitude": float(geofence["longitude"]),
+            "raio_metros": float(geofence.get("raio_metros", 200)),
+        }
+        if not valid_coordinates(parsed["latitude"], parsed["longitude"]):
+            raise ValueError("latitude/longitude fora da faixa")
+        if not (math.isfinite(parsed["raio_metros"]) and parsed["raio_metros"] > 0):
+            raise ValueError("raio_metros deve ser positivo")
+        return parsed
+    except (TypeError, KeyError, ValueError, AttributeError) as e:
+        print(f"Geofence inválida no site {site_name}, ignorando: {e!r}")
+        return None
+
+
+def distance_meters(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Distância em metros entre duas coordenadas (fórmula de haversine)"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = math.radians(lat2 - lat1)
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    # Arredondamento pode levar a um pouco acima de 1 em pontos antípodas
+    return 2 * 6371000 * math.asin(min(1.0, math.sqrt(a)))
+
+
+def valid_coordinates(lat: float, lon: float) -> bool:
+    """Latitude/longitude finitas e dentro da faixa (inf/nan quebrariam o math.cos)"""
+    return math.isfinite(lat) and math.isfinite(lon) and -90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0
+
+
+def parse_coordinates(latitude: Optional[str], longitude: Optional[str]) -> Optional[tuple[float, float]]:
+    """Converte as coordenadas enviadas pelo cliente; inválidas (inf, nan, fora da faixa) viram None"""
+    if not latitude or not longitude:
+        return None
+    try:
+        lat, lon = float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        return None
+    if not valid_coordinates(lat, lon):
+        return None
+    return lat, lon
+
+
+def resolve_site(
+    shards: dict,
+    dispositivo_info: Optional[str],
+    latitude: Optional[str],
+    longitude: Optional[str]
+) -> Optional[str]:
+    """Identifica o site da requisição pelo dispositivo ou, se não houver, pela geofence"""
+    if dispositivo_info:
+        for name, site in shards.items():
+            if dispositivo_info in site["dispositivos"]:
+                return name
+
+    coordinates = parse_coordinates(latitude, longitude)
+    if coordinates is not None:
+        lat, lon = coordinates
+        for name, site in shards.items():
+            geofence = site["geofence"]
+            if not geofence:
+                continue
+            distance = distance_meters(lat, lon, geofence["latitude"], geofence["longitude"])
+            if distance <= geofence["raio_metros"]:
+                return name
+
+    return None
+
+
+def split_by_site(shards: dict, colaboradores: list[dict], site: Optional[str]) -> tuple[list[dict], list[dict]]:
+    """Separa os colaboradores em (shard local do site, demais colaboradores)"""
+    shard = shards.get(site) if site else None
+    if shard is None:
+        return colaboradores, []
+
+    ids = shard["colaboradores"]
+    local = [c for c in colaboradores if str(c.get("id")) in ids]
+    others = [c for c in colaboradores if str(c.get("id")) not in ids]
+    return local, others
@@ -0,0 +1,142 @@
+"""
+Memória do estágio de decodificação por requisição, medida com tracemalloc
+
+tracemalloc enxerga as alocações do Python e dos arrays numpy (inclusive os
+retornados pelo OpenCV), mas não os buffers internos do libjpeg/cv::Mat.
+Os limites abaixo valem para a memória visível ao Python.
+"""
+
+import os
+import base64
+import threading
+import tracemalloc
+
+import pytest
+
+np = pytest.importorskip("numpy")
+cv2 = pytest.importorskip("cv2")
+
+# Folga para objetos Python pequenos (listas, tuplas, views)
+SLACK_BYTES = 64 * 1024
+HEIGHT, WIDTH = 960, 1280
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Blocos contados: só os alocados pelo código do serviço (sem pytest, tracemalloc e os próprios testes)
+SERVICE_CODE = [
+    tracemalloc.Filter(True, os.path.join(REPO_ROOT, "*.py")),
+    tracemalloc.Filter(False, os.path.join(REPO_ROOT, "tests", "*")),
+]
+
+
+@pytest.fixture(scope="module")
+def jpeg_bytes() -> bytes:
+    """JPEG sintético com gradiente e ruído (comprime como uma foto, não como cor sólida)"""
+    rng = np.random.default_rng(0)
+    gradient = np.add.outer(np.arange(HEIGHT), np.arange(WIDTH))[..., None] % 256
+    image = np.clip(gradient + rng.integers(0, 40, (HEIGHT, WIDTH, 3)), 0, 255).astype(np.uint8)
+    ok, encoded = cv2.imencode(".jpg", image)
+    assert ok
+    return encoded.tobytes()
+
+
+@pytest.fixture(scope="module")
+def request_base64(jpeg_bytes: bytes) -> str:
+    return "data:image/jpeg;base64," + base64.b64encode(jpeg_bytes).decode("ascii")
+
+
+def measure(func, *args) -> tuple[object, int, int]:
+    """Executa func e retorna (resultado, pico em bytes, blocos novos do serviço ainda vivos)"""
+    func(*args)  # aquecimento (caches do OpenCV, imports tardios)
+
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot().filter_traces(SERVICE_CODE)
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+
+        result = func(*args)
+
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot().filter_traces(SERVICE_CODE)
+    finally:
+        tracemalloc.stop()
+
+    new_blocks = sum(stat.count_diff for stat in after.compare_to(before, "filename") if stat.count_diff > 0)
+    return result, peak - baseline, new_blocks
+
+
+@pytest.fixture(scope="module")
+def app_opencv():
+    pytest.importorskip("fastapi")
+    import app_opencv
+    return app_opencv
+
+
+def test_opencv_captured_image_decodes_straight_to_gray(app_opencv, request_base64, jpeg_bytes):
+    image, peak, new_blocks = measure(app_opencv.base64_to_image, request_base64)
+
+    assert image.shape == (HEIGHT, WIDTH)
+    assert image.dtype == np.uint8
+    # Uma cópia ASCII do payload, os bytes do JPEG e uma única imagem em cinza:
+    # decodificar colorido e converter depois custaria mais 3 bytes por pixel
+    assert peak <= len(request_base64) + len(jpeg_bytes) + image.nbytes + SLACK_BYTES
+    # Só o array de saída (objeto ndarray + dados) continua vivo
+    assert new_blocks <= 2
+
+
+def test_opencv_request_decode_path_does_not_grow_with_collaborators(
+    app_opencv, request_base64, jpeg_bytes, monkeypatch
+):
+    # Faciais "baixadas" sem rede: o mesmo JPEG para todos os colaboradores
+    monkeypatch.setattr(app_opencv, "download_image_from_nextcloud", lambda file_path, deadline=None: jpeg_bytes)
+
+    def recognize(n_collaborators: int):
+        colaboradores = [
+            {"id": str(i), "foto_url": f"/api/nextcloud/image?path=colaboradores/{i}/facial_1.jpg"}
+            for i in range(n_collaborators)
+        ]
+        captured = app_opencv.base64_to_image(request_base64)
+        captured_face = app_opencv.detect_and_extract_face(captured)
+        if captured_face is None:
+            # Imagem sintética não tem rosto; a busca só precisa de uma face 200x200
+            captured_face = np.zeros((200, 200), np.uint8)
+        app_opencv.search_collaborators(captured_face, colaboradores, None)
+        return captured
+
+    _, peak_one, blocks_one = measure(recognize, 1)
+    captured, peak_many, blocks_many = measure(recognize, 5)
+
+    # Imagem capturada + uma facial cadastrada por vez (a anterior já foi liberada)
+    assert peak_one <= len(request_base64) + len(jpeg_bytes) + 2 * captured.nbytes + SLACK_BYTES
+    assert peak_many <= peak_one + SLACK_BYTES
+    assert blocks_many <= blocks_one
+
+
+def test_opencv_stored_face_buffer_is_reused_per_thread(app_opencv):
+    buffer = app_opencv.stored_face_buffer()
+    assert app_opencv.stored_face_buffer() is buffer
+    assert buffer.shape == (200, 200)
+
+    source = np.zeros((300, 300), np.uint8)
+    resized = cv2.resize(source, (200, 200), dst=buffer)
+    assert np.shares_memory(resized, buffer)
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(app_opencv.stored_face_buffer()))
+    thread.start()
+    thread.join()
+    assert other[0] is not buffer
+
+
+def test_face_recognition_decodes_to_rgb_in_place(request_base64, jpeg_bytes):
+    pytest.importorskip("face_recognition")
+    import app
+
+    image, peak, new_blocks = measure(app.base64_to_image, request_base64)
+
+    assert image.shape == (HEIGHT, WIDTH, 3)
+    expected = cv2.imdecode(np.frombuffer(jpeg_bytes, np.uint8), cv2.IMREAD_COLOR)[..., ::-1]
+    assert np.array_equal(image, expected)
+    # BGR -> RGB é feito no próprio buffer: nenhuma segunda imagem colorida
+    assert peak <= len(request_base64) + len(jpeg_bytes) + image.nbytes + SLACK_BYTES
+    assert new_blocks <= 2
@@ -0,0 +1,109 @@
+"""
+Pool de modelos: empréstimo exclusivo, criação sob demanda e contadores de espera/uso
+"""
+
+import time
+import threading
+
+from model_pool import ModelPool
+
+
+class Model:
+    """Modelo falso que detecta uso simultâneo da mesma instância"""
+
+    def __init__(self):
+        self.busy = False
+
+    def run(self, seconds: float):
+        assert not self.busy, "instância usada por duas threads ao mesmo tempo"
+        self.busy = True
+        time.sleep(seconds)
+        self.busy = False
+
+
+def run_threads(count: int, target):
+    errors = []
+
+    def worker():
+        try:
+            target()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+
+
+def test_instances_are_created_lazily_up_to_size():
+    pool = ModelPool(Model, 3, name="teste")
+    assert pool.metrics()["created"] == 0
+
+    with pool.lease() as first:
+        with pool.lease() as second:
+            assert first is not second
+            assert pool.metrics()["created"] == 2
+            assert pool.metrics()["in_use"] == 2
+
+    # Instâncias devolvidas são reaproveitadas antes de criar novas
+    with pool.lease():
+        pass
+    assert pool.metrics()["created"] == 2
+
+
+def test_add_counts_toward_size():
+    pool = ModelPool(Model, 1)
+    preloaded = Model()
+    pool.add(preloaded)
+    pool.add(Model())  # além do tamanho: ignorado
+
+    with pool.lease() as model:
+        assert model is preloaded
+    assert pool.metrics()["created"] == 1
+
+
+def test_leases_are_exclusive_under_contention():
+    pool = ModelPool(Model, 2)
+    leases_per_thread = 20
+
+    def work():
+        for _ in range(leases_per_thread):
+            with pool.lease() as model:
+                model.run(0.001)
+
+    run_threads(8, work)
+
+    metrics = pool.metrics()
+    assert metrics["created"] == 2
+    assert metrics["in_use"] == 0
+    assert metrics["leases"] == 8 * leases_per_thread
+    # 8 threads disputando 2 instâncias: parte dos empréstimos precisou esperar
+    assert metrics["waits"] > 0
+    assert metrics["wait_seconds_total"] > 0
+
+
+def test_busy_seconds_accumulates_after_leases_end():
+    pool = ModelPool(Model, 4)
+
+    def work():
+        with pool.lease() as model:
+            model.run(0.05)
+
+    run_threads(4, work)
+
+    metrics = pool.metrics()
+    # Utilização instantânea volta a zero, mas o tempo emprestado fica registrado
+    assert metrics["utilization"] == 0.0
+    assert metrics["busy_seconds_total"] >= 4 * 0.05
+
+
+def test_busy_seconds_includes_leases_in_progress():
+    pool = ModelPool(Model, 1)
+    with pool.lease():
+        time.sleep(0.05)
+        during = pool.metrics()["busy_seconds_total"]
+    assert during >= 0.05
+    assert pool.metrics()["busy_seconds_total"] >= during
@@ -0,0 +1,73 @@
+"""
+Download de faciais com deadline contra um servidor HTTP local
+"""
+
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("requests")
+
+from nextcloud import download_with_deadline
+
+BODY = bytes(range(256)) * 1024
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/faltando.jpg":
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        if self.path == "/lento.jpg":
+            # Servidor que responde aos poucos: cada leitura recebe dados antes do timeout
+            for offset in range(0, len(BODY), 1024):
+                self.wfile.write(BODY[offset:offset + 1024])
+                self.wfile.flush()
+                time.sleep(0.02)
+        else:
+            self.wfile.write(BODY)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def server_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_downloads_whole_body(server_url):
+    assert download_with_deadline(f"{server_url}/facial.jpg", None, 5.0) == BODY
+    assert download_with_deadline(f"{server_url}/facial.jpg", None, 5.0, time.monotonic() + 5) == BODY
+
+
+def test_non_200_returns_none(server_url):
+    assert download_with_deadline(f"{server_url}/faltando.jpg", None, 5.0) is None
+
+
+def test_expired_deadline_skips_request():
+    # URL inválida: se a requisição fosse feita, daria erro de conexão depois de tentar
+    assert download_with_deadline("http://127.0.0.1:9/facial.jpg", None, 5.0, time.monotonic() - 1) is None
+
+
+def test_slow_server_is_cut_at_deadline(server_url):
+    # Cada leitura chega antes do timeout; só o deadline verificado entre leituras interrompe
+    start = time.monotonic()
+    result = download_with_deadline(f"{server_url}/lento.jpg", None, 5.0, start + 0.3)
+    elapsed = time.monotonic() - start
+
+    assert result is None
+    assert elapsed < 1.0
@@ -0,0 +1,94 @@
+"""
+Busca nos colaboradores: saída antecipada e resultado parcial quando o deadline acaba
+"""
+
+import time
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+pytest.importorskip("fastapi")
+
+import app_opencv
+
+FACE = np.zeros((200, 200), np.uint8)
+
+
+def colaboradores(count: int) -> list[dict]:
+    return [
+        {"id": str(i), "foto_url": f"/api/nextcloud/image?path=colaboradores/{i}/facial_1.jpg"}
+        for i in range(count)
+    ]
+
+
+@pytest.fixture
+def downloads(monkeypatch) -> list[str]:
+    """Faciais sem rede: registra os paths baixados e pula decodificação/detecção"""
+    paths = []
+
+    def download(file_path, deadline=None):
+        paths.append(file_path)
+        return b"jpeg"
+
+    monkeypatch.setattr(app_opencv, "download_image_from_nextcloud", download)
+    monkeypatch.setattr(app_opencv, "bytes_to_image", lambda image_data: FACE)
+    monkeypatch.setattr(app_opencv, "detect_and_extract_face", lambda image, out=None: FACE)
+    return paths
+
+
+def test_stops_at_first_high_confidence_match(downloads, monkeypatch):
+    monkeypatch.setattr(app_opencv, "compare_faces_opencv", lambda captured, stored: (True, 0.95))
+
+    lista = colaboradores(5)
+    best_match, best_score, partial = app_opencv.search_collaborators(FACE, lista, None)
+
+    assert best_match is lista[0]
+    assert best_score == 0.95
+    assert partial is False
+    assert len(downloads) == 1
+
+
+def test_keeps_searching_below_early_exit_score(downloads, monkeypatch):
+    scores = iter([0.7, 0.8, 0.75])
+    monkeypatch.setattr(app_opencv, "compare_faces_opencv", lambda captured, stored: (True, next(scores)))
+
+    lista = colaboradores(3)
+    best_match, best_score, partial = app_opencv.search_collaborators(FACE, lista, None)
+
+    assert best_match is lista[1]
+    assert best_score == 0.8
+    assert partial is False
+    assert len(downloads) == 3
+
+
+def test_expired_deadline_returns_partial_without_downloading(downloads):
+    best_match, best_score, partial = app_opencv.search_collaborators(
+        FACE, colaboradores(3), time.monotonic() - 1
+    )
+
+    assert (best_match, best_score, partial) == (None, 0.0, True)
+    assert downloads == []
+
+
+def test_download_cut_by_deadline_is_partial_even_for_last_collaborator(monkeypatch):
+    def slow_download(file_path, deadline=None):
+        # Servidor lento: o download é interrompido quando o orçamento acaba
+        time.sleep(max(0.0, deadline - time.monotonic()) + 0.01)
+        return None
+
+    monkeypatch.setattr(app_opencv, "download_image_from_nextcloud", slow_download)
+
+    best_match, best_score, partial = app_opencv.search_collaborators(
+        FACE, colaboradores(1), time.monotonic() + 0.05
+    )
+
+    assert (best_match, best_score, partial) == (None, 0.0, True)
+
+
+def test_failed_download_without_deadline_is_not_partial(monkeypatch):
+    monkeypatch.setattr(app_opencv, "download_image_from_nextcloud", lambda file_path, deadline=None: None)
+
+    best_match, best_score, partial = app_opencv.search_collaborators(FACE, colaboradores(2), None)
+
+    assert (best_match, best_score, partial) == (None, 0.0, False)
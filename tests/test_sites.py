@@ -0,0 +1,127 @@
+"""
+Shards por site: carga da configuração, identificação do site e separação dos colaboradores
+"""
+
+import json
+import asyncio
+
+import pytest
+
+from sites import distance_meters, load_site_shards, resolve_site, split_by_site
+
+CONFIG = {
+    "sites": {
+        "matriz": {
+            "dispositivos": ["totem-01"],
+            "geofence": {"latitude": -23.5505, "longitude": -46.6333, "raio_metros": 300},
+            "colaboradores": ["1", 2],
+        },
+        "filial": {
+            "dispositivos": ["totem-02"],
+            "colaboradores": ["3"],
+        },
+    }
+}
+
+
+def write_config(tmp_path, content) -> str:
+    path = tmp_path / "sites.json"
+    path.write_text(content if isinstance(content, str) else json.dumps(content), encoding="utf-8")
+    return str(path)
+
+
+@pytest.fixture
+def shards(tmp_path) -> dict:
+    return load_site_shards(write_config(tmp_path, CONFIG))
+
+
+def test_missing_file_means_no_shards(tmp_path):
+    assert load_site_shards(str(tmp_path / "nao-existe.json")) == {}
+    assert load_site_shards("") == {}
+
+
+def test_load_normalizes_ids_to_strings(shards):
+    assert shards["matriz"]["colaboradores"] == {"1", "2"}
+    assert shards["filial"]["geofence"] is None
+
+
+@pytest.mark.parametrize("content", [
+    '{"sites": {"matriz": ',
+    {"sites": [1, 2]},
+    [],
+    {"sites": {"matriz": "totem-01"}},
+    {"sites": {"matriz": {"dispositivos": "totem-01"}}},
+    {"sites": {"matriz": {"colaboradores": "123"}}},
+])
+def test_invalid_config_raises(tmp_path, content):
+    with pytest.raises(ValueError):
+        load_site_shards(write_config(tmp_path, content))
+
+
+def test_invalid_geofence_is_ignored(tmp_path):
+    config = {"sites": {
+        "sem-lat": {"geofence": {"longitude": -46.6}},
+        "infinita": {"geofence": {"latitude": "inf", "longitude": -46.6}},
+        "raio-negativo": {"geofence": {"latitude": -23.5, "longitude": -46.6, "raio_metros": -1}},
+    }}
+    shards = load_site_shards(write_config(tmp_path, config))
+    assert all(site["geofence"] is None for site in shards.values())
+
+
+def test_resolve_by_device_before_geofence(shards):
+    # Dispositivo da filial dentro da geofence da matriz: o dispositivo vale
+    assert resolve_site(shards, "totem-02", "-23.5505", "-46.6333") == "filial"
+    # Só o id completo do dispositivo identifica o site
+    assert resolve_site(shards, "t", None, None) is None
+
+
+def test_resolve_by_geofence(shards):
+    assert resolve_site(shards, None, "-23.5510", "-46.6330") == "matriz"
+    assert resolve_site(shards, "desconhecido", "-22.9099", "-47.0626") is None
+
+
+@pytest.mark.parametrize("latitude,longitude", [
+    ("inf", "-46.6333"),
+    ("-23.5505", "-inf"),
+    ("nan", "nan"),
+    ("91", "-46.6333"),
+    ("-23.5505", "181"),
+    ("abc", "-46.6333"),
+])
+def test_invalid_coordinates_fall_back_to_global_search(shards, latitude, longitude):
+    assert resolve_site(shards, None, latitude, longitude) is None
+
+
+def test_distance_of_antipodal_points_does_not_raise():
+    assert distance_meters(0.0, 0.0, 0.0, 180.0) == pytest.approx(3.14159 * 6371000, rel=1e-4)
+
+
+def test_split_by_site(shards):
+    colaboradores = [{"id": "1"}, {"id": 2}, {"id": "3"}, {"id": "4"}]
+    local, others = split_by_site(shards, colaboradores, "matriz")
+    assert [c["id"] for c in local] == ["1", 2]
+    assert [c["id"] for c in others] == ["3", "4"]
+
+    # Sem site (ou site desconhecido): busca global
+    assert split_by_site(shards, colaboradores, None) == (colaboradores, [])
+    assert split_by_site(shards, colaboradores, "outro") == (colaboradores, [])
+
+
+def test_reload_keeps_current_shards_on_invalid_config(tmp_path, monkeypatch):
+    pytest.importorskip("fastapi")
+    pytest.importorskip("cv2")
+    import app_opencv
+
+    path = write_config(tmp_path, CONFIG)
+    monkeypatch.setattr(app_opencv, "SITES_CONFIG_PATH", path)
+    monkeypatch.setattr(app_opencv, "site_shards", {})
+
+    result = asyncio.run(app_opencv.reload_sites())
+    assert result == {"success": True, "sites": ["filial", "matriz"]}
+
+    write_config(tmp_path, '{"sites": {"matriz": ')
+    result = asyncio.run(app_opencv.reload_sites())
+    assert result["success"] is False
+    assert result["error"]
+    assert result["sites"] == ["filial", "matriz"]
+    assert set(app_opencv.site_shards) == {"filial", "matriz"}